@@ -12,8 +12,10 @@ import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), 'backend'))
 
 from backend.behavioral_analyzer import analyze_behavior
-from backend.persona_engine import get_or_create_persona, update_persona, save_persona, get_persona_summary
-from backend.rag_handler import setup_rag_chain, get_rag_response
+from backend.persona_engine import (
+    get_or_create_persona, update_persona, append_persona_event, save_persona, format_persona_summary, SNAPSHOT_INTERVAL
+)
+from backend.rag_handler import setup_rag_chain, prefetch_context, stream_rag_response
 
 # --- Page Configuration ---
 st.set_page_config(
@@ -27,6 +29,10 @@ st.set_page_config(
 # OPENAI_API_KEY="sk-..."
 load_dotenv()
 
+# --- Constants ---
+CHAT_HISTORY_WINDOW = 8 # How many recent messages are sent to the LLM as chat history
+DISPLAY_WINDOW = 20 # How many recent messages are rendered in the chat view
+
 # --- Functions ---
 
 @st.cache_resource
@@ -39,6 +45,26 @@ def load_rag_chain():
         st.stop()
     return setup_rag_chain(knowledge_base_path)
 
+@st.cache_data(ttl=600, max_entries=256, show_spinner=False)
+def cached_persona_summary(user_id, version, top_topics, style, sentiment, avg_speed, avg_length):
+    """
+    Cache the sidebar markdown across reruns. Only hashable scalars are passed so
+    hashing stays cheap; user_id and version scope each entry to one persona state.
+    """
+    return format_persona_summary(sentiment, style, avg_speed, avg_length, top_topics)
+
+def render_persona_summary(persona: dict) -> str:
+    """Get the (cached) sidebar summary for a persona."""
+    return cached_persona_summary(
+        persona["user_id"],
+        persona["version"],
+        tuple(topic for topic, _ in persona["contextual_preferences"]["top_topics"]),
+        persona["communication_style"],
+        persona["emotional_state"]["current_sentiment"],
+        persona["behavioral_patterns"]["avg_typing_speed"],
+        persona["behavioral_patterns"]["avg_message_length"]
+    )
+
 def initialize_session_state():
     """Initialize variables in Streamlit's session state."""
     if "user_id" not in st.session_state:
@@ -75,11 +101,11 @@ with st.sidebar:
     st.header("🧠 Dynamic User Persona")
     st.caption("This profile updates in real-time based on your interactions.")
     persona_summary_placeholder = st.empty()
-    persona_summary_placeholder.markdown(get_persona_summary(st.session_state.persona))
+    persona_summary_placeholder.markdown(render_persona_summary(st.session_state.persona))
 
 # --- Chat Interface ---
-# Display chat messages
-for msg in st.session_state.messages:
+# Display the most recent chat messages; the full history stays in session state
+for msg in st.session_state.messages[-DISPLAY_WINDOW:]:
     with st.chat_message(msg["role"]):
         st.write(msg["content"])
 
@@ -90,6 +116,9 @@ if prompt := st.chat_input("What would you like to ask?"):
     with st.chat_message("user"):
         st.write(prompt)
 
+    # Start retrieving context in the background while the persona is updated
+    context_future = prefetch_context(st.session_state.rag_chain, prompt)
+
     # --- Behavioral Analysis ---
     current_time = time.time()
     time_since_last_message = current_time - st.session_state.last_message_time
@@ -99,24 +128,26 @@ if prompt := st.chat_input("What would you like to ask?"):
 
     # --- Persona Update ---
     st.session_state.persona = update_persona(st.session_state.persona, behavioral_data)
-    save_persona(st.session_state.persona) # Save the updated persona
-    persona_summary_placeholder.markdown(get_persona_summary(st.session_state.persona)) # Update sidebar
+    append_persona_event(st.session_state.persona, behavioral_data) # Log this interaction
+    if st.session_state.persona["interaction_count"] % SNAPSHOT_INTERVAL == 0:
+        save_persona(st.session_state.persona) # Periodically write a full snapshot
+    persona_summary_placeholder.markdown(render_persona_summary(st.session_state.persona)) # Update sidebar
 
     # --- Get AI Response ---
     with st.chat_message("assistant"):
-        with st.spinner("Thinking..."):
-            # Prepare context for the RAG chain
-            chat_history = [f"{msg['role']}: {msg['content']}" for msg in st.session_state.messages]
-            
-            # Get response from the RAG chain
-            response = get_rag_response(
-                rag_chain=st.session_state.rag_chain,
-                question=prompt,
-                chat_history=chat_history,
-                persona=st.session_state.persona
-            )
-            
-            st.write(response)
+        # Prepare context for the RAG chain
+        # Only the most recent messages are sent, so prompt size stays bounded
+        recent_messages = st.session_state.messages[-CHAT_HISTORY_WINDOW:]
+        chat_history = [f"{msg['role']}: {msg['content']}" for msg in recent_messages]
+
+        # Stream the response from the RAG chain as it is generated
+        response = st.write_stream(stream_rag_response(
+            rag_chain=st.session_state.rag_chain,
+            question=prompt,
+            chat_history=chat_history,
+            persona=st.session_state.persona,
+            context=context_future.result()
+        ))
 
     # Add assistant response to chat history
     st.session_state.messages.append({"role": "assistant", "content": response})
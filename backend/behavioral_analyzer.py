@@ -2,8 +2,24 @@
 # └── 📁 backend/
 #     └── 📄 behavioral_analyzer.py
 
-import time
-from textblob import TextBlob
+from bisect import bisect_right
+
+import spacy
+from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+
+# --- NLP Pipeline ---
+# Loaded once at import time. Only the tagger is needed for noun extraction,
+# so the parser, lemmatizer and NER components are disabled.
+# The model is installed separately: python -m spacy download en_core_web_sm (see README)
+_NLP = spacy.load("en_core_web_sm", disable=["parser", "lemmatizer", "ner"])
+_SENTIMENT = SentimentIntensityAnalyzer()
+
+# Bucket edges (in seconds between messages) and the typing speed label for each bucket
+_SPEED_EDGES = (2, 5, 15)
+_SPEED_LABELS = ("very_fast", "fast", "moderate", "slow")
+
+# Nouns too generic to count as topics
+_COMMON_WORDS = frozenset(("user", "chatbot", "question", "answer", "information"))
 
 def analyze_typing_speed(time_diff_seconds: float) -> str:
     """
@@ -11,55 +27,56 @@ def analyze_typing_speed(time_diff_seconds: float) -> str:
     In a real web app, this would be replaced with frontend JavaScript
     that captures actual keystroke timings.
     """
-    if time_diff_seconds < 2:
-        return "very_fast"
-    elif time_diff_seconds < 5:
-        return "fast"
-    elif time_diff_seconds < 15:
-        return "moderate"
-    else:
-        return "slow"
+    return _SPEED_LABELS[bisect_right(_SPEED_EDGES, time_diff_seconds)]
 
-def detect_emotion(text: str) -> dict:
+def detect_emotion(doc) -> dict:
     """
-    Detects emotion from text using TextBlob for sentiment analysis.
-    Polarity: [-1, 1] (negative to positive)
-    Subjectivity: [0, 1] (objective to subjective)
+    Detects emotion from a parsed spaCy Doc using the VADER sentiment lexicon.
+    Polarity: VADER's compound score in [-1, 1] (negative to positive). It replaced
+    TextBlob polarity but keeps the same +/-0.3 cut-offs, so older persisted
+    sentiment histories are on a slightly different scale.
     """
-    blob = TextBlob(text)
-    polarity = blob.sentiment.polarity
-    
+    polarity = _SENTIMENT.polarity_scores(doc.text)["compound"]
+
     if polarity > 0.3:
         sentiment = "positive"
     elif polarity < -0.3:
         sentiment = "negative"
     else:
         sentiment = "neutral"
-        
+
     return {"polarity": round(polarity, 2), "sentiment": sentiment}
 
-def map_context(text: str) -> list:
+def map_context(doc) -> list:
     """
-    Extracts key topics (nouns) from the text to understand the context.
+    Extracts key topics (nouns) from a parsed spaCy Doc to understand the context.
     This is a simplified approach; more advanced methods like NER could be used.
     """
-    blob = TextBlob(text)
     # Filter for nouns and exclude common words
-    common_words = {"user", "chatbot", "question", "answer", "information"}
-    topics = [word.lower() for word, pos in blob.tags if pos.startswith('NN') and word.lower() not in common_words]
-    return list(set(topics))
+    topics = {token.lower_ for token in doc if token.pos_ in ("NOUN", "PROPN")}
+    return list(topics - _COMMON_WORDS)
+
+def _behavior_from_doc(doc, time_since_last_message: float) -> dict:
+    """Builds the behavioral data dictionary for a single parsed message."""
+    return {
+        "typing_speed": analyze_typing_speed(time_since_last_message),
+        "emotion": detect_emotion(doc),
+        "topics": map_context(doc),
+        "message_length": len(doc.text.split())
+    }
+
+def analyze_behavior_batch(user_inputs: list, times_since_last_message: list) -> list:
+    """
+    Runs the behavioral analyses over several messages at once.
+    spaCy's `pipe` processes the texts in batches, which is much cheaper than
+    parsing each message separately when re-analyzing a conversation history.
+    """
+    docs = _NLP.pipe(user_inputs, batch_size=32)
+    return [_behavior_from_doc(doc, time_diff) for doc, time_diff in zip(docs, times_since_last_message, strict=True)]
 
 def analyze_behavior(user_input: str, time_since_last_message: float) -> dict:
     """
     Main function to run all behavioral analyses and return a consolidated dictionary.
+    The input is parsed once and the resulting Doc is shared by all analyses.
     """
-    typing_speed = analyze_typing_speed(time_since_last_message)
-    emotion = detect_emotion(user_input)
-    topics = map_context(user_input)
-    
-    return {
-        "typing_speed": typing_speed,
-        "emotion": emotion,
-        "topics": topics,
-        "message_length": len(user_input.split())
-    }
+    return _behavior_from_doc(_NLP(user_input), time_since_last_message)
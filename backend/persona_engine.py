@@ -3,96 +3,219 @@
 #     └── 📄 persona_engine.py
 
 import os
-import json
+import orjson
+from bisect import bisect_left
 from collections import deque
+from functools import lru_cache
 
 # --- Constants ---
 PERSONA_DIR = "personas"
 HISTORY_LENGTH = 10 # How many of the last data points to keep for averaging
+TOP_TOPICS_COUNT = 3 # How many of the most frequent topics to track
+MAX_TOPICS = 128 # Least frequent topics are evicted beyond this many
+SNAPSHOT_INTERVAL = 10 # Write a full persona snapshot every N interactions
+
+# Numeric score for each typing speed label, used for averaging
+_SPEED_MAP = {"very_fast": 4, "fast": 3, "moderate": 2, "slow": 1}
+
+# Average speed scores above each edge map to the next, faster label
+_AVG_SPEED_EDGES = (1.5, 2.5, 3.5)
+_AVG_SPEED_LABELS = ("slow", "moderate", "fast", "very_fast")
+
+os.makedirs(PERSONA_DIR, exist_ok=True)
 
 # --- Persona Data Structure ---
 def create_new_persona(user_id: str) -> dict:
     """Creates a default persona structure for a new user."""
-    if not os.path.exists(PERSONA_DIR):
-        os.makedirs(PERSONA_DIR)
-    
     return {
         "user_id": user_id,
         "communication_style": "neutral", # Adapts to formal/informal
         "emotional_state": {
             "current_sentiment": "neutral",
-            "sentiment_history": list(deque(maxlen=HISTORY_LENGTH))
+            "sentiment_history": deque(maxlen=HISTORY_LENGTH)
         },
         "behavioral_patterns": {
             "avg_typing_speed": "moderate",
-            "speed_history": list(deque(maxlen=HISTORY_LENGTH)),
+            "speed_history": deque(maxlen=HISTORY_LENGTH),
+            "speed_sum": 0,
             "avg_message_length": 20,
-            "length_history": list(deque(maxlen=HISTORY_LENGTH))
+            "length_history": deque(maxlen=HISTORY_LENGTH),
+            "length_sum": 0
         },
         "contextual_preferences": {
             "topic_interests": {}, # Stores topics and their frequency
+            "top_topics": [], # [topic, count] pairs of the most frequent topics, highest first
         },
-        "interaction_count": 0
+        "interaction_count": 0,
+        "version": 0 # Bumped on every update; used to cache derived views
     }
 
 # --- Persona Management ---
+@lru_cache(maxsize=256)
 def get_persona_filepath(user_id: str) -> str:
     """Constructs the file path for a user's persona data."""
     return os.path.join(PERSONA_DIR, f"{user_id}_persona.json")
 
+@lru_cache(maxsize=256)
+def get_persona_log_filepath(user_id: str) -> str:
+    """Constructs the file path for a user's persona event log."""
+    return os.path.join(PERSONA_DIR, f"{user_id}_persona.log")
+
 def get_or_create_persona(user_id: str) -> dict:
-    """Loads a persona from a file or creates a new one if it doesn't exist."""
-    filepath = get_persona_filepath(user_id)
-    if os.path.exists(filepath):
-        with open(filepath, 'r') as f:
-            persona_data = json.load(f)
-            # Ensure deques are properly loaded if needed, though lists are fine for JSON
-            return persona_data
-    return create_new_persona(user_id)
+    """
+    Loads a persona from its latest snapshot (or creates a new one), then
+    replays any events logged since that snapshot was written.
+    """
+    try:
+        persona = _load_persona_snapshot(get_persona_filepath(user_id))
+    except FileNotFoundError:
+        persona = create_new_persona(user_id)
+    _replay_persona_events(persona)
+    return persona
+
+def _load_persona_snapshot(filepath: str) -> dict:
+    """Reads a persona snapshot and restores its in-memory structures."""
+    with open(filepath, 'rb') as f:
+        persona_data = orjson.loads(f.read())
+    # Histories are stored as JSON lists; hold them as bounded deques in memory
+    emotional_state = persona_data["emotional_state"]
+    emotional_state["sentiment_history"] = deque(emotional_state["sentiment_history"], maxlen=HISTORY_LENGTH)
+    patterns = persona_data["behavioral_patterns"]
+    patterns["speed_history"] = deque(patterns["speed_history"], maxlen=HISTORY_LENGTH)
+    patterns["length_history"] = deque(patterns["length_history"], maxlen=HISTORY_LENGTH)
+    # Running sums are recomputed so older files without them load correctly
+    patterns["speed_sum"] = sum(patterns["speed_history"])
+    patterns["length_sum"] = sum(patterns["length_history"])
+    persona_data.setdefault("version", persona_data["interaction_count"])
+    preferences = persona_data["contextual_preferences"]
+    if "top_topics" not in preferences:
+        top_topics = sorted(preferences["topic_interests"].items(), key=lambda item: item[1], reverse=True)
+        preferences["top_topics"] = [list(item) for item in top_topics[:TOP_TOPICS_COUNT]]
+    _evict_rare_topics(preferences)
+    return persona_data
+
+def _replay_persona_events(persona: dict):
+    """Applies logged events newer than the persona's snapshot."""
+    try:
+        f = open(get_persona_log_filepath(persona["user_id"]), 'r+b')
+    except FileNotFoundError:
+        return
+    with f:
+        valid_end = 0
+        for line in f:
+            if not line.endswith(b"\n"):
+                # A crash mid-append left a partial last line; drop it so the
+                # next append starts on a clean line
+                f.truncate(valid_end)
+                break
+            valid_end += len(line)
+            event = orjson.loads(line)
+            # Events already contained in the snapshot are skipped
+            if event["seq"] > persona["interaction_count"]:
+                update_persona(persona, event["behavioral_data"])
+
+def append_persona_event(persona: dict, behavioral_data: dict):
+    """
+    Appends one interaction's behavioral data to the user's event log.
+    Call this after `update_persona`; the full snapshot only needs to be
+    written every SNAPSHOT_INTERVAL interactions.
+    """
+    event = {"seq": persona["interaction_count"], "behavioral_data": behavioral_data}
+    with open(get_persona_log_filepath(persona["user_id"]), 'ab') as f:
+        f.write(orjson.dumps(event) + b"\n")
 
 def save_persona(persona: dict):
-    """Saves the persona dictionary to its JSON file."""
+    """Saves the persona dictionary to its JSON file and clears the event log it supersedes."""
     filepath = get_persona_filepath(persona["user_id"])
-    with open(filepath, 'w') as f:
-        json.dump(persona, f, indent=4)
+    # Copy the nested sections so the in-memory deques are left untouched
+    emotional_state = dict(persona["emotional_state"])
+    emotional_state["sentiment_history"] = list(emotional_state["sentiment_history"])
+    patterns = dict(persona["behavioral_patterns"])
+    patterns["speed_history"] = list(patterns["speed_history"])
+    patterns["length_history"] = list(patterns["length_history"])
+    persona_data = {**persona, "emotional_state": emotional_state, "behavioral_patterns": patterns}
+    # Write to a temp file and swap it in, so a crash never leaves a half-written snapshot
+    temp_filepath = f"{filepath}.tmp"
+    with open(temp_filepath, 'wb') as f:
+        f.write(orjson.dumps(persona_data, option=orjson.OPT_INDENT_2))
+    os.replace(temp_filepath, filepath)
+    # Every logged event is now part of the snapshot
+    open(get_persona_log_filepath(persona["user_id"]), 'w').close()
 
 # --- Persona Adaptation ---
+def _append_history(history: deque, value) -> float:
+    """Appends a value to a bounded history and returns the value it evicted (0 if none)."""
+    evicted = history[0] if len(history) == history.maxlen else 0
+    history.append(value)
+    return evicted
+
+def _update_top_topics(top_topics: list, topic: str, count: int):
+    """
+    Keeps the cached top topics in sync after a topic's count increased.
+    Counts only ever grow, so a topic can only enter the list by beating its current minimum.
+    """
+    for entry in top_topics:
+        if entry[0] == topic:
+            entry[1] = count
+            break
+    else:
+        if len(top_topics) < TOP_TOPICS_COUNT:
+            top_topics.append([topic, count])
+        elif count > top_topics[-1][1]:
+            top_topics[-1] = [topic, count]
+        else:
+            return
+    top_topics.sort(key=lambda entry: entry[1], reverse=True)
+
+def _evict_rare_topics(preferences: dict, touched: tuple = ()):
+    """
+    Keeps at most MAX_TOPICS topics. When the cap is exceeded all counts are halved
+    (topics reaching 0 are dropped) so old interests can't block newcomers forever,
+    then the least frequent remaining topics are evicted. Top topics and topics
+    touched by the current update are never evicted.
+    """
+    topic_interests = preferences["topic_interests"]
+    if len(topic_interests) <= MAX_TOPICS:
+        return
+    protected = {entry[0] for entry in preferences["top_topics"]}.union(touched)
+    for topic, count in list(topic_interests.items()):
+        if count // 2 == 0 and topic not in protected:
+            del topic_interests[topic]
+        else:
+            topic_interests[topic] = max(count // 2, 1)
+    # Stable sort: among equal counts the oldest topics go first
+    evictable = sorted((topic for topic in topic_interests if topic not in protected), key=topic_interests.get)
+    for topic in evictable[:len(topic_interests) - MAX_TOPICS]:
+        del topic_interests[topic]
+    # Halving keeps the order of counts, so only the cached values need refreshing
+    for entry in preferences["top_topics"]:
+        entry[1] = topic_interests[entry[0]]
+    preferences["top_topics"].sort(key=lambda entry: entry[1], reverse=True)
+
 def update_persona(persona: dict, behavioral_data: dict) -> dict:
     """Updates the persona based on new behavioral data."""
-    # Update interaction count
+    # Update interaction count and version
     persona["interaction_count"] += 1
+    persona["version"] += 1
 
     # Update emotional state
     emotion = behavioral_data["emotion"]
     persona["emotional_state"]["current_sentiment"] = emotion["sentiment"]
-    # Use a simple list to act like a deque for JSON serialization
-    sentiment_history = persona["emotional_state"]["sentiment_history"]
-    sentiment_history.append(emotion["polarity"])
-    if len(sentiment_history) > HISTORY_LENGTH:
-        sentiment_history.pop(0)
-    persona["emotional_state"]["sentiment_history"] = sentiment_history
-
-    # Update behavioral patterns
-    speed_map = {"very_fast": 4, "fast": 3, "moderate": 2, "slow": 1}
-    speed_history = persona["behavioral_patterns"]["speed_history"]
-    speed_history.append(speed_map.get(behavioral_data["typing_speed"], 2))
-    if len(speed_history) > HISTORY_LENGTH:
-        speed_history.pop(0)
-    persona["behavioral_patterns"]["speed_history"] = speed_history
-    
+    # Histories are bounded deques, so old entries are evicted automatically
+    persona["emotional_state"]["sentiment_history"].append(emotion["polarity"])
+
+    # Update behavioral patterns, keeping running sums so averages are O(1)
+    patterns = persona["behavioral_patterns"]
+    speed_value = _SPEED_MAP.get(behavioral_data["typing_speed"], 2)
+    patterns["speed_sum"] += speed_value - _append_history(patterns["speed_history"], speed_value)
+
     # Determine average speed
-    avg_speed_val = sum(speed_history) / len(speed_history) if speed_history else 2
-    if avg_speed_val > 3.5: persona["behavioral_patterns"]["avg_typing_speed"] = "very_fast"
-    elif avg_speed_val > 2.5: persona["behavioral_patterns"]["avg_typing_speed"] = "fast"
-    elif avg_speed_val > 1.5: persona["behavioral_patterns"]["avg_typing_speed"] = "moderate"
-    else: persona["behavioral_patterns"]["avg_typing_speed"] = "slow"
+    avg_speed_val = patterns["speed_sum"] / len(patterns["speed_history"])
+    patterns["avg_typing_speed"] = _AVG_SPEED_LABELS[bisect_left(_AVG_SPEED_EDGES, avg_speed_val)]
 
-    length_history = persona["behavioral_patterns"]["length_history"]
-    length_history.append(behavioral_data["message_length"])
-    if len(length_history) > HISTORY_LENGTH:
-        length_history.pop(0)
-    persona["behavioral_patterns"]["length_history"] = length_history
-    persona["behavioral_patterns"]["avg_message_length"] = round(sum(length_history) / len(length_history), 1) if length_history else 20
+    length_value = behavioral_data["message_length"]
+    patterns["length_sum"] += length_value - _append_history(patterns["length_history"], length_value)
+    patterns["avg_message_length"] = round(patterns["length_sum"] / len(patterns["length_history"]), 1)
 
 
     # Update communication style based on message length
@@ -104,26 +227,26 @@ def update_persona(persona: dict, behavioral_data: dict) -> dict:
         persona["communication_style"] = "neutral"
 
     # Update topic interests
+    topic_interests = persona["contextual_preferences"]["topic_interests"]
     for topic in behavioral_data["topics"]:
-        persona["contextual_preferences"]["topic_interests"][topic] = persona["contextual_preferences"]["topic_interests"].get(topic, 0) + 1
+        topic_interests[topic] = topic_interests.get(topic, 0) + 1
+        _update_top_topics(persona["contextual_preferences"]["top_topics"], topic, topic_interests[topic])
+    _evict_rare_topics(persona["contextual_preferences"], touched=tuple(behavioral_data["topics"]))
 
     return persona
 
-def get_persona_summary(persona: dict) -> str:
-    """Generates a markdown summary of the current persona state."""
-    summary = f"""
-    - **Emotion**: `{persona['emotional_state']['current_sentiment'].capitalize()}`
-    - **Comm. Style**: `{persona['communication_style'].capitalize()}`
-    - **Avg. Speed**: `{persona['behavioral_patterns']['avg_typing_speed'].replace('_', ' ').capitalize()}`
-    - **Avg. Length**: `{persona['behavioral_patterns']['avg_message_length']}` words
-    """
-    
-    # Get top 3 topics
-    topics = persona["contextual_preferences"]["topic_interests"]
-    if topics:
-        top_topics = sorted(topics.items(), key=lambda item: item[1], reverse=True)[:3]
-        summary += "\n- **Top Topics**:\n"
-        for topic, _ in top_topics:
-            summary += f"  - `{topic.capitalize()}`\n"
-            
-    return summary
+def format_persona_summary(sentiment: str, style: str, avg_speed: str, avg_length: float, top_topics: tuple) -> str:
+    """Formats the persona summary markdown from plain values."""
+    lines = [
+        f"- **Emotion**: `{sentiment.capitalize()}`",
+        f"- **Comm. Style**: `{style.capitalize()}`",
+        f"- **Avg. Speed**: `{avg_speed.replace('_', ' ').capitalize()}`",
+        f"- **Avg. Length**: `{avg_length}` words",
+    ]
+
+    # Add top topics
+    if top_topics:
+        lines.append("- **Top Topics**:")
+        lines.extend(f"  - `{topic.capitalize()}`" for topic in top_topics)
+
+    return "\n".join(lines)
@@ -2,36 +2,138 @@
 # └── 📁 backend/
 #     └── 📄 rag_handler.py
 
+import hashlib
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+
+import faiss
 from langchain_community.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
+from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_openai import ChatOpenAI
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.prompts import PromptTemplate
-from langchain.schema.runnable import RunnablePassthrough
 from langchain.schema.output_parser import StrOutputParser
 
+# --- Constants ---
+INDEX_DIR = "index" # Persisted FAISS indexes, one folder per knowledge base version
+EMBEDDING_MODEL = "BAAI/bge-small-en-v1.5" # Local sentence-transformers embedding model
+INDEX_QUANTIZER = "QT_8bit" # faiss.ScalarQuantizer type used for the persisted index
+CHUNK_SIZE = 500 # Chunk size in embedding-model tokens (the model's limit is 512)
+CHUNK_OVERLAP = 50
+
+# Background threads for retrieval that runs alongside behavioral analysis
+_EXECUTOR = ThreadPoolExecutor(max_workers=4)
+
+logger = logging.getLogger(__name__)
+
+# Errors raised when a persisted index is corrupt or was written by incompatible
+# faiss/langchain versions: faiss read failures surface as RuntimeError, and the
+# pickled docstore can fail to unpickle or reference classes that moved.
+_INDEX_LOAD_ERRORS = (OSError, RuntimeError, EOFError, pickle.UnpicklingError, AttributeError, ImportError)
+
+def _quantize_index(vectorstore: FAISS):
+    """Replaces the store's float32 flat index with a scalar-quantized (INDEX_QUANTIZER) copy."""
+    index = vectorstore.index
+    vectors = index.reconstruct_n(0, index.ntotal)
+    quantized_index = faiss.IndexScalarQuantizer(index.d, getattr(faiss.ScalarQuantizer, INDEX_QUANTIZER))
+    quantized_index.train(vectors)
+    quantized_index.add(vectors)
+    vectorstore.index = quantized_index
+
+def _embedding_tokenizer(embeddings: HuggingFaceEmbeddings):
+    """Returns the tokenizer of the SentenceTransformer already loaded by `embeddings`."""
+    # langchain-huggingface keeps the model in a private attribute (`client` in older releases)
+    model = getattr(embeddings, "_client", None) or getattr(embeddings, "client", None)
+    tokenizer = getattr(model, "tokenizer", None)
+    if tokenizer is None:
+        raise RuntimeError(
+            "Could not find the SentenceTransformer tokenizer on HuggingFaceEmbeddings; "
+            "langchain-huggingface may have renamed its model attribute."
+        )
+    return tokenizer
+
+def _load_index(index_path: str, embeddings):
+    """Loads a persisted index, or returns None if it is missing or unreadable."""
+    if not all(os.path.isfile(os.path.join(index_path, name)) for name in ("index.faiss", "index.pkl")):
+        return None
+    try:
+        # The index was written by this module, so its pickled docstore is trusted
+        return FAISS.load_local(index_path, embeddings, allow_dangerous_deserialization=True)
+    except _INDEX_LOAD_ERRORS as e:
+        logger.warning("Could not load persisted index at %s (%s: %s); rebuilding it.", index_path, type(e).__name__, e)
+        return None
+
+def _save_index(vectorstore: FAISS, index_path: str):
+    """
+    Saves the index to a temp folder and renames it into place, so other processes
+    never see a partially written index at `index_path`.
+    """
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    temp_path = tempfile.mkdtemp(prefix=".tmp-", dir=INDEX_DIR)
+    try:
+        vectorstore.save_local(temp_path)
+    except Exception:
+        shutil.rmtree(temp_path, ignore_errors=True)
+        raise
+    try:
+        os.replace(temp_path, index_path)
+    except OSError:
+        # Another process published the same index first
+        shutil.rmtree(temp_path, ignore_errors=True)
+
 def setup_vector_store(file_path: str):
-    """Loads a text file, splits it, creates embeddings, and sets up a FAISS vector store."""
+    """
+    Loads a text file, splits it, creates embeddings, and sets up a FAISS vector store.
+    The index (including its chunk texts) is saved under INDEX_DIR keyed by a hash of the
+    model, index type, chunking settings and file contents, so restarts reuse it instead of
+    re-splitting and re-embedding an unchanged knowledge base.
+    """
     with open(file_path, 'r', encoding='utf-8') as f:
         text = f.read()
-    
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
-        length_function=len
+
+    embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL, encode_kwargs={"normalize_embeddings": True})
+    # The model, index type and chunking settings are part of the key, since changing any changes the index
+    index_settings = f"{EMBEDDING_MODEL}\n{INDEX_QUANTIZER}\n{CHUNK_SIZE}\n{CHUNK_OVERLAP}"
+    index_key = hashlib.sha1(f"{index_settings}\n{text}".encode('utf-8')).hexdigest()
+    index_path = os.path.join(INDEX_DIR, index_key)
+    vectorstore = _load_index(index_path, embeddings)
+    if vectorstore is not None:
+        return vectorstore.as_retriever()
+    # Clear out any incomplete folder left by an interrupted build
+    shutil.rmtree(index_path, ignore_errors=True)
+
+    # Measure chunks in the embedding model's own tokens so none are truncated at embed time
+    text_splitter = RecursiveCharacterTextSplitter.from_huggingface_tokenizer(
+        _embedding_tokenizer(embeddings),
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP
     )
     chunks = text_splitter.split_text(text)
-    
-    embeddings = OpenAIEmbeddings()
+
     vectorstore = FAISS.from_texts(texts=chunks, embedding=embeddings)
+    _quantize_index(vectorstore)
+    _save_index(vectorstore, index_path)
     return vectorstore.as_retriever()
 
 def create_persona_aware_prompt(persona: dict) -> PromptTemplate:
     """Creates a dynamic prompt template based on the user's persona."""
-    
-    # Determine the tone based on persona
     sentiment = persona['emotional_state']['current_sentiment']
     style = persona['communication_style']
+    topics = tuple(topic for topic, _ in persona["contextual_preferences"]["top_topics"])
+    return _build_prompt(sentiment, style, topics)
 
+@lru_cache(maxsize=64)
+def _build_prompt(sentiment: str, style: str, topics: tuple) -> PromptTemplate:
+    """
+    Builds the prompt template for a persona signature. Most turns share the same
+    (sentiment, style, topics) combination, so templates are cached and reused.
+    """
+    # Determine the tone based on persona
     tone_instruction = "Your tone should be helpful and neutral."
     if sentiment == 'positive':
         tone_instruction = "Your tone should be upbeat and encouraging."
@@ -45,11 +147,10 @@ def create_persona_aware_prompt(persona: dict) -> PromptTemplate:
     elif style == 'detailed':
         length_instruction = "Provide a detailed, in-depth answer, explaining the concepts clearly."
 
-    # Get top topics to prime the context
-    top_topics = sorted(persona["contextual_preferences"]["topic_interests"].items(), key=lambda item: item[1], reverse=True)
+    # Use top topics to prime the context
     topic_hint = ""
-    if top_topics:
-        topic_hint = f"The user is often interested in topics like {', '.join([t[0] for t in top_topics[:3]])}."
+    if topics:
+        topic_hint = f"The user is often interested in topics like {', '.join(topics)}."
 
     template_string = f"""
 You are a persona-adaptive AI assistant. Your goal is to answer the user's question accurately based on the provided context, while adapting your communication style to the user's current persona.
@@ -83,35 +184,41 @@ def setup_rag_chain(file_path: str):
     """Initializes the entire RAG chain with a static retriever."""
     retriever = setup_vector_store(file_path)
     llm = ChatOpenAI(model_name="gpt-3.5-turbo", temperature=0.7)
-    
+
     # The chain will be constructed dynamically in the response function
-    # based on the latest persona.
-    return {"retriever": retriever, "llm": llm}
+    # based on the latest persona; the parser is shared across calls.
+    return {"retriever": retriever, "llm": llm, "parser": StrOutputParser()}
 
 
-def get_rag_response(rag_chain: dict, question: str, chat_history: list, persona: dict) -> str:
+def prefetch_context(rag_chain: dict, question: str) -> Future:
     """
-    Gets a response from the RAG chain using the dynamic, persona-aware prompt.
+    Starts retrieving context for the question on a background thread, so the
+    embedding and search overlap with behavioral analysis on the main thread.
     """
-    retriever = rag_chain['retriever']
-    llm = rag_chain['llm']
-    
-    # Create the persona-aware prompt for this specific interaction
-    prompt_template = create_persona_aware_prompt(persona)
-    
-    # Construct the chain for this specific call
-    rag_chain_dynamic = (
-        {"context": retriever, "question": RunnablePassthrough(), "chat_history": RunnablePassthrough(), "persona": RunnablePassthrough()}
-        | prompt_template
-        | llm
-        | StrOutputParser()
-    )
+    return _EXECUTOR.submit(rag_chain['retriever'].invoke, question)
 
-    # Invoke the chain with all necessary inputs
-    response = rag_chain_dynamic.invoke({
+
+def _build_inputs(rag_chain: dict, question: str, chat_history: list, context) -> dict:
+    """Prepares the prompt inputs, retrieving context now if it wasn't prefetched."""
+    if context is None:
+        context = rag_chain['retriever'].invoke(question)
+    return {
+        "context": "\n\n".join(doc.page_content for doc in context),
         "question": question,
-        "chat_history": "\n".join(chat_history),
-        "persona": persona # Pass the whole persona object if the prompt needs more details
-    })
-    
-    return response
+        "chat_history": "\n".join(chat_history)
+    }
+
+
+def _build_persona_chain(rag_chain: dict, persona: dict):
+    """Plugs the persona-aware prompt in front of the shared LLM and parser."""
+    return create_persona_aware_prompt(persona) | rag_chain['llm'] | rag_chain['parser']
+
+
+def stream_rag_response(rag_chain: dict, question: str, chat_history: list, persona: dict, context: list = None):
+    """
+    Streams the response from the RAG chain chunk by chunk as the LLM generates it,
+    so the UI can start rendering before the full answer is available.
+    Pass `context` (e.g. from `prefetch_context`) to skip retrieval here.
+    """
+    inputs = _build_inputs(rag_chain, question, chat_history, context)
+    return _build_persona_chain(rag_chain, persona).stream(inputs)
@@ -0,0 +1,33 @@
+# 📂 persona_adaptive_chatbot/
+# └── 📁 tests/
+#     └── 📄 test_behavioral_analyzer.py
+
+import os
+import sys
+import unittest
+
+# Make the project root importable, as app.py does for the backend
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+try:
+    from backend.behavioral_analyzer import analyze_typing_speed
+except (ImportError, OSError): # spaCy or its en_core_web_sm model is not installed
+    analyze_typing_speed = None
+
+
+@unittest.skipIf(analyze_typing_speed is None, "behavioral_analyzer needs spaCy and en_core_web_sm")
+class TypingSpeedTest(unittest.TestCase):
+
+    def test_bucket_edges(self):
+        # Gaps exactly on an edge fall into the slower bucket (strict < comparisons)
+        cases = [
+            (0, "very_fast"), (1.99, "very_fast"), (2, "fast"),
+            (4.99, "fast"), (5, "moderate"),
+            (14.99, "moderate"), (15, "slow"), (120, "slow"),
+        ]
+        for time_diff, expected in cases:
+            self.assertEqual(analyze_typing_speed(time_diff), expected, time_diff)
+
+
+if __name__ == "__main__":
+    unittest.main()
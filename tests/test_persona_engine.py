@@ -0,0 +1,207 @@
+# 📂 persona_adaptive_chatbot/
+# └── 📁 tests/
+#     └── 📄 test_persona_engine.py
+
+import os
+import random
+import sys
+import tempfile
+import unittest
+
+import orjson
+
+# Make the project root importable, as app.py does for the backend
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from backend import persona_engine
+from backend.persona_engine import (
+    append_persona_event, create_new_persona, get_or_create_persona, get_persona_filepath,
+    get_persona_log_filepath, save_persona, update_persona
+)
+
+
+def make_behavioral_data(i: int) -> dict:
+    """Builds deterministic behavioral data for the i-th interaction."""
+    return {
+        "typing_speed": ("very_fast", "fast", "moderate", "slow")[i % 4],
+        "emotion": {"polarity": 0.5, "sentiment": "positive"},
+        "topics": [f"topic{i % 5}", "python"],
+        "message_length": i
+    }
+
+
+def topic_data(topics: list, typing_speed: str = "moderate", message_length: int = 5) -> dict:
+    """Builds behavioral data mentioning the given topics."""
+    return {
+        "typing_speed": typing_speed,
+        "emotion": {"polarity": 0.0, "sentiment": "neutral"},
+        "topics": topics,
+        "message_length": message_length
+    }
+
+
+class TopTopicsAssertions:
+    """Shared check that the cached top topics match a full sort of topic_interests."""
+
+    def assertTopTopicsConsistent(self, persona: dict):
+        preferences = persona["contextual_preferences"]
+        topic_interests = preferences["topic_interests"]
+        expected = sorted(topic_interests.items(), key=lambda item: item[1], reverse=True)[:persona_engine.TOP_TOPICS_COUNT]
+        top_topics = preferences["top_topics"]
+        # Ties may order names differently, so compare counts and check each cached entry is live
+        self.assertEqual([count for _, count in top_topics], [count for _, count in expected])
+        for topic, count in top_topics:
+            self.assertEqual(topic_interests.get(topic), count)
+        self.assertEqual(len({topic for topic, _ in top_topics}), len(top_topics))
+
+
+def interact(persona: dict, n: int) -> dict:
+    """Runs n interactions the way app.py does: update, log, periodic snapshot."""
+    for _ in range(n):
+        behavioral_data = make_behavioral_data(persona["interaction_count"])
+        update_persona(persona, behavioral_data)
+        append_persona_event(persona, behavioral_data)
+        if persona["interaction_count"] % persona_engine.SNAPSHOT_INTERVAL == 0:
+            save_persona(persona)
+    return persona
+
+
+class PersonaUpdateTest(TopTopicsAssertions, unittest.TestCase):
+    """In-memory persona updates: top topics, eviction, running sums and speed buckets."""
+
+    def test_top_topics_track_full_sort(self):
+        persona = create_new_persona("alice")
+        rng = random.Random(0)
+        for _ in range(300):
+            update_persona(persona, topic_data(rng.sample([f"t{i}" for i in range(12)], 3)))
+            self.assertTopTopicsConsistent(persona)
+
+    def test_top_topics_survive_eviction(self):
+        persona = create_new_persona("alice")
+        rng = random.Random(1)
+        for _ in range(400):
+            topics = ["python"] + [f"t{rng.randrange(1000)}" for _ in range(3)]
+            update_persona(persona, topic_data(topics))
+            self.assertLessEqual(len(persona["contextual_preferences"]["topic_interests"]), persona_engine.MAX_TOPICS)
+            self.assertTopTopicsConsistent(persona)
+
+    def test_new_topic_can_enter_saturated_interests(self):
+        persona = create_new_persona("alice")
+        old_topics = [f"old{i}" for i in range(persona_engine.MAX_TOPICS)]
+        for _ in range(2):
+            update_persona(persona, topic_data(old_topics))
+        self.assertEqual(set(persona["contextual_preferences"]["topic_interests"].values()), {2})
+
+        for _ in range(50):
+            update_persona(persona, topic_data(["rust"]))
+            self.assertIn("rust", persona["contextual_preferences"]["topic_interests"])
+            self.assertTopTopicsConsistent(persona)
+
+        self.assertEqual(persona["contextual_preferences"]["top_topics"][0][0], "rust")
+        self.assertLessEqual(len(persona["contextual_preferences"]["topic_interests"]), persona_engine.MAX_TOPICS)
+
+    def test_running_sums_match_histories(self):
+        persona = create_new_persona("alice")
+        speeds = ("very_fast", "fast", "moderate", "slow")
+        for i in range(3 * persona_engine.HISTORY_LENGTH + 1):
+            update_persona(persona, topic_data([], typing_speed=speeds[i % 4], message_length=i * 7 % 40))
+            patterns = persona["behavioral_patterns"]
+            self.assertEqual(patterns["speed_sum"], sum(patterns["speed_history"]))
+            self.assertEqual(patterns["length_sum"], sum(patterns["length_history"]))
+            self.assertEqual(patterns["avg_message_length"], round(sum(patterns["length_history"]) / len(patterns["length_history"]), 1))
+
+    def test_avg_speed_bucket_edges(self):
+        # Averages exactly on an edge stay in the slower bucket (strict > comparisons)
+        cases = [
+            (("slow", "moderate"), "slow"),          # 1.5
+            (("moderate", "fast"), "moderate"),      # 2.5
+            (("fast", "very_fast"), "fast"),         # 3.5
+            (("moderate", "moderate"), "moderate"),  # 2.0
+            (("very_fast", "very_fast"), "very_fast"),
+        ]
+        for speeds, expected in cases:
+            persona = create_new_persona("alice")
+            for speed in speeds:
+                update_persona(persona, topic_data([], typing_speed=speed))
+            self.assertEqual(persona["behavioral_patterns"]["avg_typing_speed"], expected, speeds)
+
+
+class PersonaPersistenceTest(TopTopicsAssertions, unittest.TestCase):
+    """Snapshot + event log persistence, run in an empty working directory."""
+
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self._tmp = tempfile.TemporaryDirectory()
+        os.chdir(self._tmp.name)
+        os.makedirs(persona_engine.PERSONA_DIR)
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        self._tmp.cleanup()
+
+    def test_snapshot_and_log_round_trip(self):
+        persona = interact(get_or_create_persona("alice"), 23)
+
+        reloaded = get_or_create_persona("alice")
+
+        self.assertEqual(reloaded, persona)
+        self.assertEqual(reloaded["interaction_count"], 23)
+
+    def test_save_truncates_log(self):
+        persona = interact(get_or_create_persona("alice"), 3)
+        save_persona(persona)
+
+        self.assertEqual(os.path.getsize(get_persona_log_filepath("alice")), 0)
+        self.assertEqual(get_or_create_persona("alice"), persona)
+
+    def test_events_covered_by_snapshot_are_skipped(self):
+        persona = interact(get_or_create_persona("alice"), 4)
+        log_filepath = get_persona_log_filepath("alice")
+        with open(log_filepath, 'rb') as f:
+            logged_events = f.read()
+        save_persona(persona)
+        # Simulate a crash between writing the snapshot and truncating the log
+        with open(log_filepath, 'wb') as f:
+            f.write(logged_events)
+
+        self.assertEqual(get_or_create_persona("alice"), persona)
+
+    def test_partial_last_log_line_is_dropped(self):
+        persona = interact(get_or_create_persona("alice"), 3)
+        with open(get_persona_log_filepath("alice"), 'ab') as f:
+            f.write(b'{"seq":4,"behavioral_da')
+
+        self.assertEqual(get_or_create_persona("alice"), persona)
+
+        # Later appends start on a clean line again
+        interact(persona, 2)
+        self.assertEqual(get_or_create_persona("alice"), persona)
+
+    def test_snapshot_without_top_topics_is_backfilled(self):
+        persona = create_new_persona("alice")
+        for topics in (["a", "b"], ["b", "c"], ["b", "d"], ["c"], ["e"]):
+            update_persona(persona, topic_data(topics))
+        save_persona(persona)
+        # Rewrite the snapshot the way files from before top_topics looked
+        with open(get_persona_filepath("alice"), 'rb') as f:
+            persona_data = orjson.loads(f.read())
+        del persona_data["contextual_preferences"]["top_topics"]
+        with open(get_persona_filepath("alice"), 'wb') as f:
+            f.write(orjson.dumps(persona_data))
+
+        reloaded = get_or_create_persona("alice")
+
+        self.assertTopTopicsConsistent(reloaded)
+        self.assertEqual(reloaded["contextual_preferences"]["top_topics"][:2], [["b", 3], ["c", 2]])
+        update_persona(reloaded, topic_data(["e", "e2"]))
+        self.assertTopTopicsConsistent(reloaded)
+
+    def test_save_leaves_no_temp_file(self):
+        persona = interact(get_or_create_persona("alice"), 20)
+
+        self.assertTrue(os.path.exists(get_persona_filepath("alice")))
+        self.assertEqual(sorted(os.listdir(persona_engine.PERSONA_DIR)), ["alice_persona.json", "alice_persona.log"])
+
+
+if __name__ == "__main__":
+    unittest.main()